@@ -0,0 +1,178 @@
+# compiled.py
+import logging
+import numpy as np
+import pandas as pd
+
+from objects.events import Branch, Completor, Failure, TICKS_PER_UNIT, to_ticks
+from objects.activities import Activity
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:     # numba is optional, without it the kernel below is plain Python
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+# Special values of next_success / next_failure
+COMPLETE = -1   # the ConOps is finished
+FAIL = -2       # the mission has failed, ending the simulation
+
+MAX_FAILURES = 256  # failure rows kept per replicant
+
+
+#######################################################################################################################
+# ConOps -> arrays
+
+def compile_case(case_setup):
+    """Flatten the ConOps of a case into arrays for mc_run.
+
+    Only cases made of plain activities are supported: no predicates, branches, aggregations or delays.
+    Returns None if the case needs the full simulator."""
+    index = {}          # id(activity) -> row in the arrays
+    activities = []
+
+    def row(activity):
+        if id(activity) not in index:
+            index[id(activity)] = len(activities)
+            activities.append(activity)
+        return index[id(activity)]
+
+    start_time, first = [], []
+    for time, vehicle in case_setup:
+        start_time.append(time)
+        first.append(row(vehicle.conops.first()))
+
+    next_success, next_failure = [], []
+    i = 0
+    while i < len(activities):
+        activity = activities[i]
+        if type(activity) is not Activity or activity.agg_type or activity.delay is not None:
+            return None
+
+        for event, following, links in ((activity.end, activity.next_success, next_success),
+                                        (activity.failure, activity.next_failure, next_failure)):
+            if isinstance(event, Branch):   # the outcome is decided by its logic at run time
+                return None
+            elif isinstance(event, Failure):
+                links.append(FAIL)
+            elif isinstance(event, Completor):
+                links.append(COMPLETE)
+            elif following is not None:
+                links.append(row(following))
+            else:   # events missing from the ConOps
+                return None
+        i += 1
+
+    return {
+        "start_tick": np.array([to_ticks(t) for t in start_time], dtype=np.int64),
+        "first": np.array(first, dtype=np.int32),
+        "next_success": np.array(next_success, dtype=np.int32),
+        "next_failure": np.array(next_failure, dtype=np.int32),
+        "duration_ticks": np.array([a.duration_ticks for a in activities], dtype=np.int64),
+        "p_fail": np.array([a.p_fail for a in activities], dtype=np.float64),
+        "names": [a.name for a in activities],
+        "vehicles": [vehicle.name for _, vehicle in case_setup],
+    }
+
+
+#######################################################################################################################
+# Kernel
+
+@njit(parallel=True, cache=True)
+def mc_run(n_runs, start_tick, first, next_success, next_failure, duration_ticks, p_fail, seeds):
+    """Run n_runs replications of a compiled case, reproducing the event order of Simulator.process_events"""
+    n_vehicles = len(first)
+    end_tick = np.zeros(n_runs, dtype=np.int64)
+    outcomes = np.zeros(n_runs, dtype=np.bool_)
+    n_fail = np.zeros(n_runs, dtype=np.int32)
+    fail_tick = np.zeros((n_runs, MAX_FAILURES), dtype=np.int64)
+    fail_vehicle = np.zeros((n_runs, MAX_FAILURES), dtype=np.int32)
+    fail_activity = np.zeros((n_runs, MAX_FAILURES), dtype=np.int32)
+
+    for r in prange(n_runs):
+        np.random.seed(seeds[r])
+        # Pending event of each vehicle, ordered by (time, sequence number) like the future event heap
+        t_next = start_tick.copy()
+        seq_next = np.arange(n_vehicles)
+        activity = first.copy()
+        alive = np.ones(n_vehicles, dtype=np.bool_)
+        seq = n_vehicles
+        clock = 0
+        outcome = True
+
+        while True:
+            v = -1
+            for w in range(n_vehicles):
+                if alive[w] and (v < 0 or t_next[w] < t_next[v] or (t_next[w] == t_next[v] and seq_next[w] < seq_next[v])):
+                    v = w
+            if v < 0:
+                break
+
+            clock = t_next[v]
+            a = activity[v]
+            if np.random.random() > (1 - p_fail[a]):
+                k = n_fail[r]
+                if k < MAX_FAILURES:
+                    fail_tick[r, k] = clock
+                    fail_vehicle[r, k] = v
+                    fail_activity[r, k] = a
+                n_fail[r] = k + 1
+                following = next_failure[a]
+            else:
+                following = next_success[a]
+
+            if following == FAIL:
+                outcome = False
+                break
+            elif following == COMPLETE:
+                alive[v] = False
+            else:
+                activity[v] = following
+                t_next[v] = clock + duration_ticks[a]
+                seq_next[v] = seq
+                seq += 1
+
+        end_tick[r] = clock
+        outcomes[r] = outcome
+
+    return end_tick, outcomes, n_fail, fail_tick, fail_vehicle, fail_activity
+
+
+#######################################################################################################################
+# Driver
+
+def run_compiled(case, N: int, seed = None):
+    """Monte Carlo of a compiled case, returning the same table as concatenating drivers.montecarlo.run_case"""
+    seeds = np.random.SeedSequence(seed).generate_state(N)
+    end_tick, outcomes, n_fail, fail_tick, fail_vehicle, fail_activity = mc_run(
+        N, case["start_tick"], case["first"], case["next_success"], case["next_failure"],
+        case["duration_ticks"], case["p_fail"], seeds)
+    durations = end_tick / TICKS_PER_UNIT
+    fail_time = fail_tick / TICKS_PER_UNIT
+
+    if n_fail.max(initial=0) > MAX_FAILURES:
+        logging.warning(f"Only the first {MAX_FAILURES} failures of each replicant are reported")
+    n_rows = np.minimum(n_fail, MAX_FAILURES)
+
+    # Replicants without failures get one row, the others one row per failure
+    failed = n_rows > 0
+    replicant = np.repeat(np.arange(N), np.where(failed, n_rows, 1))
+    # Failures are indexed from 1 like Simulator.failures
+    j = np.concatenate([np.arange(1, n + 1) if n else np.zeros(1, dtype=int) for n in n_rows])
+    has_row = j > 0
+    k = np.maximum(j - 1, 0)
+
+    result = pd.DataFrame({
+        "replicant": replicant,
+        "outcome": outcomes[replicant],
+        "duration": durations[replicant],
+        "anomaly_count": np.where(has_row, j + 1, 0),
+        "anomaly_time": np.where(has_row, fail_time[replicant, k], np.nan),
+        "anomaly_vehicle": np.where(has_row, np.array(case["vehicles"], dtype=object)[fail_vehicle[replicant, k]], None),
+        "anomaly_activity": np.where(has_row, np.array(case["names"], dtype=object)[fail_activity[replicant, k]], None),
+    }, index=j)
+
+    return result
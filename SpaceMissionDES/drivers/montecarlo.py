@@ -1,23 +1,23 @@
 # montecarlo.py
-import asyncio
 from csv import Dialect
 import logging
 from typing import Callable
 from drivers.simulator import Simulator
+from drivers.compiled import HAVE_NUMBA, compile_case, run_compiled
 from tqdm import tqdm
 from multiprocessing import Pool
-from functools import partial
+import numpy as np
 import pandas as pd
 
 def run_case(i, case_setup):
     """."""
     sim = Simulator()
+    sim.run(case_setup)
+    return case_result(i, sim)
 
-    try:
-        asyncio.run(
-            sim.run(case_setup)
-        )
-    except asyncio.CancelledError:
+
+def case_result(i, sim: Simulator):
+    if not sim.success:
         logging.warning("CONOPS FAILED")
 
     logging.info(f"Mission Success: {sim.success}")
@@ -54,21 +54,43 @@ def run_case(i, case_setup):
     return result
 
 
+# Simulator primed with the case vehicles and its snapshot, one per process
+_primed = None
+
+def prime_case(case_setup):
+    global _primed
+    sim = Simulator()
+    sim.add_vehicles(case_setup)
+    _primed = (sim, sim.snapshot())
+
+
+def run_replicant(i):
+    """Run a replication by restoring the primed simulator instead of rebuilding the case"""
+    sim, snapshot = _primed
+    sim.restore(snapshot, rng=np.random.default_rng())
+    sim.process_events()
+    return case_result(i, sim)
+
+
 def run_montecarlo(case_setup, N: int, run_parallel = True):
     logging.info("\nRun Monte Carlo")
 
-    case = partial(run_case, case_setup=case_setup)
+    # Cases without predicates, branches, aggregations or delays can run in the compiled kernel
+    if HAVE_NUMBA and (compiled := compile_case(case_setup)) is not None:
+        logging.info("Using the compiled Monte Carlo kernel")
+        return run_compiled(compiled, N)
 
     if run_parallel:
-        with Pool() as p:
+        with Pool(initializer=prime_case, initargs=(case_setup,)) as p:
             mc_results = list(tqdm(
-                p.imap_unordered(case, range(N)), 
+                p.imap_unordered(run_replicant, range(N)), 
                 total=N))
 
     else:
+        prime_case(case_setup)
         mc_results = list(
             tqdm(
-                map(case, range(N)),
+                map(run_replicant, range(N)),
                 total=N))
 
     return pd.concat(mc_results)
\ No newline at end of file
@@ -1,80 +1,106 @@
 # simulator.py
 
 from dataclasses import dataclass, field
-import asyncio
-import random
+from heapq import heappop, heappush
+import copy
 import logging
+import numpy as np
 import pandas as pd
 from collections import Counter
 
 from objects.events import *
 from objects.vehicles import Vehicle
 from objects.activities import *
+from objects.predicates import state_key
 
+ANY_STATE = "*"     # predicate index key for predicates without declared dependencies
+RAND_BATCH = 4096   # uniform draws generated at once for the activity failure trials
 
-def new_future_queue():
-    """Create a new event loop and Queue for each simulator instance, needed for Monte Carlo"""
-    new_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(new_loop)
-    return asyncio.Queue()
+# Trace buffers start at this length and grow by this factor when full
+DEFAULT_BUFFER_SIZE = 128
+BUFFER_EXTEND_SIZE = 1.25
+
+logger = logging.getLogger(__name__)
+# Levels enabled on logger, refreshed at the start of each run so the hot path only tests a flag
+_info = False
+_warn = False
+
+def _update_log_levels():
+    global _info, _warn
+    _info = logger.isEnabledFor(logging.INFO)
+    _warn = logger.isEnabledFor(logging.WARNING)
 
 @dataclass
 class Simulator:
     entities: dict = field(default_factory = lambda: {})
     # no default, we cannot start a sim without entities ?
-    failures: pd.DataFrame = pd.DataFrame(columns=["Time", "Vehicle", "Activity"])
-    future: FutureEventList = FutureEventList()
-    tasks: list = field(default_factory = lambda: [])
-    predicates: list = field(default_factory = lambda: [])
-    clock: float = 0.0
+    failures_rows: list = field(default_factory = lambda: [])
+    future: list = field(default_factory = lambda: [])     # heap of (tick, sequence number, event)
+    _seq: int = 0                                           # breaks ties between events at the same time in FIFO order
+    predicates: dict = field(default_factory = lambda: {})          # id(predicated event) -> predicated event
+    predicate_index: dict = field(default_factory = lambda: {})     # state key -> {id: predicated event} depending on it
+    dirty_keys: dict = field(default_factory = lambda: {})          # state keys changed since the last check (ordered set)
+    key_versions: dict = field(default_factory = lambda: {})        # state key -> number of times it changed
+    predicate_checks: dict = field(default_factory = lambda: {})    # id(predicated event) -> key versions at last check
+    clock: float = 0.0      # current time, in time units
+    tick: int = 0           # current time, in ticks of 1/TICKS_PER_UNIT
     success: bool = False
-    queue_future: asyncio.Queue = field(default_factory = new_future_queue)
+    rng: np.random.Generator = field(default_factory = np.random.default_rng, repr = False)   # failure trials and delays
+    _rand_buf: np.ndarray = field(default = None, repr = False)
+    _rand_i: int = field(default = 0, repr = False)
+    # Vehicle trace, stored as one array per column. Names are mapped to small integer ids
+    trace_time: np.ndarray = field(default_factory = lambda: np.zeros(DEFAULT_BUFFER_SIZE), repr = False)
+    trace_vid: np.ndarray = field(default_factory = lambda: np.zeros(DEFAULT_BUFFER_SIZE, dtype=np.int32), repr = False)
+    trace_aid: np.ndarray = field(default_factory = lambda: np.zeros(DEFAULT_BUFFER_SIZE, dtype=np.int32), repr = False)
+    n_trace: int = 0
+    vehicle_names: list = field(default_factory = lambda: [])    # vehicle id -> name, activity ids are in ACTIVITY_IDS
+
+    def process_events(self):
+        # Local names for everything used on each event
+        future = self.future
+        schedule = self.schedule
+        pending_predicates = self.pending_predicates
+        # Handlers of the events returned by handle_event, indexed by event.kind. A true result ends the run
+        handlers = (schedule, self._on_failure, self._on_completion, self.add_predicate)
+        _update_log_levels()
+
+        while future:
+            tick, _, event = heappop(future)
 
-    async def process_events(self):
-        for event in self.future:
-            
             # Update the Clock and do any vehicle state updates
-            self.clock = event.time
-            event.state_update()  # fuction called which was defined in the activity_handler
-            
-            # trigger the event
-            event.set()
-
-            # Get the next event -- we use await here to pass control back and forth between the main scheduler and the activity handlers
-            new_event = await self.queue_future.get()
+            self.tick = tick
+            self.clock = tick / TICKS_PER_UNIT
+            event.state_update()  # fuction called which was defined in handle_event
+
+            # Start the activity waiting on this event, which gives back the vehicle's next event.
+            # The ConOps handler is a faster handle_event generated for simple ConOps, it does not log
+            vehicle = event.vehicle
+            handler = vehicle.conops.handler
+            if handler is None or _info:
+                handler = handle_event
+            new_event = handler(self, vehicle, event)
 
             # Handle each type of event
-            if isinstance(new_event, FailureEvent):                             # Failure events lead to canceling the sim outright
-                logging.info(f"\tFAILURE @ time {new_event.time}")
-                self.cancel_tasks()
-                # Cleanup
-                for excess_event in self.future:
-                    excess_event.set()
-
+            if handlers[new_event.kind](new_event):
                 return # Exit the process_events loop immediately
 
-            elif isinstance(new_event, CompletionEvent):                        # Completion events conclude a ConOps and DO NOT schedule new events
-                logging.info(f"\tTERMINAL EVENT named {new_event.name} @ time {new_event.time}")
-
-            elif new_event.predicate != None:                                   # Predicate events are added to predicates, not scheduled until satisfied
-                self.predicates.append(new_event)
-
-            else:
-                self.schedule(new_event)
-
             # ----------------------------------------------
-            # Sim state has been updated -- CHECK PREDICATES
-            for p in self.predicates:
+            # Sim state has been updated -- CHECK PREDICATES which depend on the updated state
+            fired = []
+            for p in pending_predicates():
                 try:
                     if p.predicate.check(p, self):  # calls unqiue functions to check predicate -> bool
-                        # Shedule the event to occur immediately
-                        p.time = self.clock
-                        self.schedule(p)
-                        # Remove the predicate so it wont be activated twice
-                        self.predicates.remove(p)
+                        fired.append(p)
                 except AttributeError:
                     continue
 
+            for p in fired:
+                # Shedule the event to occur immediately
+                p.tick = tick
+                schedule(p)
+                # Remove the predicate so it wont be activated twice
+                self.remove_predicate(p)
+
             # testing alternative approach
             # for vehicle, predicate in self.predicates.items():
             #     if predicate.activity in [a.name for a in vehicle.trace.loc[:, "Activity"]]:
@@ -85,54 +111,190 @@ class Simulator:
 
         # Only log success if all predicates have been satisfied
         if len(self.predicates) == 0:
-            logging.info("\nCOMPLETE\n")
+            logger.info("\nCOMPLETE\n")
             self.success = True
         else:
-            logging.warn(f"\nINcomplete predicates: {[p.predicate.name for p in self.predicates]}\n")
+            logger.warning(f"\nINcomplete predicates: {[p.predicate.name for p in self.predicates.values()]}\n")
+
+    def _on_failure(self, event: FailureEvent) -> bool:
+        # Failure events lead to canceling the sim outright
+        if _info:
+            logger.info(f"\tFAILURE @ time {event.time}")
+        self.future.clear()
+        return True
+
+    def _on_completion(self, event: CompletionEvent):
+        # Completion events conclude a ConOps and DO NOT schedule new events
+        if _info:
+            logger.info(f"\tTERMINAL EVENT named {event.name} @ time {event.time}")
 
     def schedule(self, event: ScheduledEvent):
-        heappush(self.future.events, event)
-
-    def add_activity(self, name: str, start: ScheduledEvent, vehicle: Vehicle):
-        self.tasks.append(
-            asyncio.create_task(
-                activity_handler(name, start, self, vehicle),
-                name = f"Vehicle: {vehicle.name} | INIT"
-            )
-        )
+        heappush(self.future, (event.tick, self._seq, event))
+        self._seq += 1
+
+    def bernoulli(self, p: float) -> bool:
+        """Bernoulli trial with success probability p, drawn from a pre-generated batch of uniforms"""
+        i = self._rand_i
+        if self._rand_buf is None or i == len(self._rand_buf):
+            self._rand_buf = self.rng.random(RAND_BATCH)
+            i = 0
+        self._rand_i = i + 1
+        return self._rand_buf[i] > (1 - p)
+
+    def touch(self, vehicle_name: str, attr: str):
+        """Mark a piece of vehicle state as changed so the predicates depending on it are checked again"""
+        if not self.predicates:
+            return  # nothing waits on vehicle state, add_predicate flags the keys of new predicates itself
+        key = state_key(vehicle_name, attr)
+        # Only keys some waiting predicate depends on need a new version
+        if self.predicate_index.get(key):
+            self.dirty_keys[key] = None
+            self.key_versions[key] = self.key_versions.get(key, 0) + 1
+
+    def add_predicate(self, event: ScheduledEvent):
+        self.predicates[id(event)] = event
+        if event.predicate.depends_on is None:
+            self.predicate_index.setdefault(ANY_STATE, {})[id(event)] = event
+        for key in event.predicate.depends_on or ():
+            self.predicate_index.setdefault(key, {})[id(event)] = event
+            # Flag the key without bumping its version, so only the new predicate gets its first check
+            self.dirty_keys[key] = None
+
+    def remove_predicate(self, event: ScheduledEvent):
+        del self.predicates[id(event)]
+        for key in event.predicate.depends_on or (ANY_STATE,):
+            del self.predicate_index[key][id(event)]
+        self.predicate_checks.pop(id(event), None)
+
+    def pending_predicates(self) -> list:
+        """Predicated events whose dependencies changed since they were last checked"""
+        pending = list(self.predicate_index.get(ANY_STATE, {}).values())
+        for key in self.dirty_keys:
+            for p in self.predicate_index.get(key, {}).values():
+                versions = tuple(self.key_versions.get(k, 0) for k in p.predicate.depends_on)
+                # Skip predicates already checked against this exact state
+                if self.predicate_checks.get(id(p)) != versions:
+                    self.predicate_checks[id(p)] = versions
+                    pending.append(p)
+        self.dirty_keys.clear()
+        return pending
 
     def add_vehicle(self, vehicle: Vehicle, start_time: float):
         # Add the vehicle to the entities list
         self.entities.update({vehicle.name: vehicle})
+        vehicle.vid = len(self.vehicle_names)
+        self.vehicle_names.append(vehicle.name)
         # Get the first activity in the vehicles's conops and schedule it
         activity = vehicle.conops.first()
         # Schedule the intial event
-        INIT = ScheduledEvent(activity.start.name, activity.start, start_time)
-        self.schedule(INIT)                     # This INIT event will be .set() at time zero
-        self.add_activity(activity.name, INIT, vehicle)  # This activity will comments when the INIT event is .set()
-
-    async def run(self, initial_vehicles):
+        INIT = ScheduledEvent(activity.start.name, activity.start, to_ticks(start_time), vehicle=vehicle)
+        self.schedule(INIT)                     # This INIT event will start the first activity at the start time
+        vehicle.next_activity = activity
 
+    def add_vehicles(self, initial_vehicles):
         for start_time, vehicle in initial_vehicles:
             self.add_vehicle(vehicle, start_time)
 
-        self.tasks.append(
-            asyncio.create_task(self.process_events(), name="process_event")
+    def run(self, initial_vehicles, expected_events: int = None):
+        if expected_events is not None:
+            self.reserve_trace(expected_events)
+        self.add_vehicles(initial_vehicles)
+        self.process_events()
+
+    def snapshot(self) -> tuple:
+        """Copy of the mutable simulation state, e.g. after add_vehicles, which restore can reinstall. Picklable
+        when taken before the run starts.
+
+        ConOps and activities are static and shared, vehicles are saved as (vehicle, attributes) so that
+        the scheduled events pointing at them stay valid."""
+        return (
+            list(self.future),
+            self._seq,
+            {name: (vehicle, _copy_attributes(vars(vehicle))) for name, vehicle in self.entities.items()},
+            (dict(self.predicates), {key: dict(ps) for key, ps in self.predicate_index.items()},
+             dict(self.dirty_keys), dict(self.key_versions), dict(self.predicate_checks)),
+            (list(self.failures_rows), self.n_trace, list(self.vehicle_names)),
+            (self.clock, self.tick, self.success),
+            (self.rng.bit_generator.state, None if self._rand_buf is None else self._rand_buf.copy(), self._rand_i),
         )
 
-        await asyncio.gather(*self.tasks)
+    def restore(self, snapshot: tuple, rng: np.random.Generator = None):
+        """Reinstall a snapshot. Without rng the random state is restored too and the run is replayed exactly,
+        since failure trials and delays are all drawn from self.rng. Give a new generator to start an independent
+        replication"""
+        future, self._seq, entities, predicates, logs, times, random_state = snapshot
+
+        self.future[:] = future
+        self.entities = {}
+        for name, (vehicle, attributes) in entities.items():
+            vars(vehicle).update(_copy_attributes(attributes))
+            self.entities[name] = vehicle
+
+        predicates, predicate_index, dirty_keys, key_versions, predicate_checks = predicates
+        self.predicates = dict(predicates)
+        self.predicate_index = {key: dict(ps) for key, ps in predicate_index.items()}
+        self.dirty_keys = dict(dirty_keys)
+        self.key_versions = dict(key_versions)
+        self.predicate_checks = dict(predicate_checks)
+
+        failures_rows, self.n_trace, vehicle_names = logs
+        self.failures_rows = list(failures_rows)
+        self.vehicle_names = list(vehicle_names)
+        self.clock, self.tick, self.success = times
+
+        if rng is None:
+            rng_state, rand_buf, self._rand_i = random_state
+            self.rng.bit_generator.state = rng_state
+            self._rand_buf = None if rand_buf is None else rand_buf.copy()
+        else:
+            self.rng = rng
+            self._rand_buf = None
+            self._rand_i = 0
+
+    def reserve_trace(self, size: int):
+        """Grow the trace buffers to hold at least size rows"""
+        if size > len(self.trace_time):
+            # New arrays rather than resizing in place, so views of the old buffers stay valid
+            n = self.n_trace
+            for name in ("trace_time", "trace_vid", "trace_aid"):
+                old = getattr(self, name)
+                buffer = np.zeros(size, dtype=old.dtype)
+                buffer[:n] = old[:n]
+                setattr(self, name, buffer)
+
+    def _record(self, vid: int, aid: int, time: float):
+        """Append a row to the trace buffers, growing them when full"""
+        n = self.n_trace
+        if n == len(self.trace_time):
+            self.reserve_trace(int(n * BUFFER_EXTEND_SIZE) + 1)
+        self.trace_time[n] = time
+        self.trace_vid[n] = vid
+        self.trace_aid[n] = aid
+        self.n_trace = n + 1
+
+    @property
+    def trace(self) -> pd.DataFrame:
+        """Activities started by each vehicle, in order of occurrence"""
+        n = self.n_trace
+        activity_names = np.array(list(ACTIVITY_IDS), dtype=object)
+        return pd.DataFrame({
+            "Time": self.trace_time[:n],
+            "Vehicle": np.array(self.vehicle_names, dtype=object)[self.trace_vid[:n]],
+            "Activity": activity_names[self.trace_aid[:n]],
+        })
 
     def log_failure(self, time, vehicle, activity):
-        self.failures = pd.concat([
-            self.failures,
-            pd.DataFrame({"Time":time, "Vehicle": vehicle, "Activity": activity}, index = [len(self.failures) + 1])
-        ])
-
-    def cancel_tasks(self):
-        for task in self.tasks:
-            if task.get_name() != 'process_event' and not task.done():
-                logging.debug(f'CANCEL -> {task}')
-                task.cancel()
+        # Rows are only collected here, the DataFrame is built once on demand by `failures`
+        self.failures_rows.append((time, vehicle, activity))
+
+    @property
+    def failures(self) -> pd.DataFrame:
+        """Failures logged so far as a DataFrame, indexed from 1 in order of occurrence"""
+        return pd.DataFrame(
+            self.failures_rows,
+            columns = ["Time", "Vehicle", "Activity"],
+            index = range(1, len(self.failures_rows) + 1)
+        )
 
     def __repr__(self) -> str:
 
@@ -145,43 +307,65 @@ class Simulator:
         return (sim_text)
 
 
-async def activity_handler(name: str, start: ScheduledEvent, sim: Simulator, vehicle: Vehicle):
+def _copy_attributes(attributes: dict) -> dict:
+    # Copy the containers a vehicle mutates during a run
+    return {key: copy.copy(value) if isinstance(value, (dict, list)) else value for key, value in attributes.items()}
+
+
+def handle_event(sim: Simulator, vehicle: Vehicle, start: ScheduledEvent) -> ScheduledEvent:
+
+    clock = sim.clock
+    touch = sim.touch
 
     # An activity begins when the start event has been scheduled AND picked off the future event list
-    await start.wait()
-    logging.info(f"\n\tEVENT:  {start.name}  @ time {sim.clock:.2f}")
+    if _info:
+        logger.info(f"\n\tEVENT:  {start.name}  @ time {clock:.2f}")
 
     # Activty is handling is used at the beginning of an event
-    current_activity = vehicle.conops.after(start)  # <- this gets the activity which comes after
-    logging.info(f"\t  VEHICLE {vehicle.name} > Begin ACTIVITY:  {current_activity.name}")
+    current_activity = vehicle.next_activity  # <- the activity which comes after, set when the start event was created
+    if _info:
+        logger.info(f"\t  VEHICLE {vehicle.name} > Begin ACTIVITY:  {current_activity.name}")
 
     # ---------------------------------------------------------------------------------------------
     # Test Activity Success
-    current_end = check_activity_failure(current_activity, vehicle, sim)
+    if check_activity_failure(current_activity, vehicle, sim):
+        current_end, kind, next_activity = current_activity.failure, current_activity.failure_kind, current_activity.next_failure
+    else:
+        current_end, kind, next_activity = current_activity.end, current_activity.end_kind, current_activity.next_success
 
-    # Change the end if there is a branching function
-    if isinstance(current_end, Branch):
+    # Change the end if there is a branching function, its outcome is only known at run time
+    if kind == END_BRANCH:
         current_end = current_end.logic(sim, vehicle)
+        kind = event_kind(current_end)
+        # Only one level of logic is run, a branch given back starts the activity keyed by its name
+        if kind == END_NORMAL or kind == END_BRANCH:
+            kind = END_NORMAL
+            next_activity = vehicle.conops.after(current_end)
 
     # ---------------------------------------------------------------------------------------------
     # Update the Vehicle
     vehicle.activity = current_activity
     # print(vehicle.resource)
     vehicle.resource = Counter(vehicle.resource) - Counter(current_activity.resource_change)
+    touch(vehicle.name, "activity")
+    touch(vehicle.name, "resource")
     if any(value == 0 for value in vehicle.resource.values()):
         raise Exception(f"Vehicle {vehicle.name} ran out of a tracked resource or is trying to deplete a resource that does not exist")
     # Define State variable updator which is only called when the event succeeds and the end event is triggered
-    state_update = lambda: vehicle.update_state(current_activity.update)
+    def state_update():
+        vehicle.update_state(current_activity.update)
+        touch(vehicle.name, "state")
 
     # In our approach, activity.start has already occurred.
     # So we must schedule the ending event, along with the the activity which will wait on that event
 
     # print(f"Hellooo {current_end}  on {current_activity.name}")
-    if not isinstance(current_end, Failure):
+    if kind != END_FAILURE:
         if current_activity.agg_type == "join":
             # print(f"WHAT {current_activity.agg_params['vehicles']}")
-            logging.info(f"\t  VEHICLES {current_activity.agg_params['vehicles']} > Begin ACTIVITY:  {current_activity.name}")
-            logging.info(f"\t  VEHICLES {current_activity.agg_params['vehicles']} > JOINED TO:  {current_activity.agg_params['name']}")
+            if _info:
+                logger.info(f"\t  VEHICLES {current_activity.agg_params['vehicles']} > Begin ACTIVITY:  {current_activity.name}")
+                logger.info(f"\t  VEHICLES {current_activity.agg_params['vehicles']} > JOINED TO:  {current_activity.agg_params['name']}")
             # print(current_activity.agg_params['vehicles'])
             if len(current_activity.agg_params['vehicles']) < 2:
                 raise Exception("Not enough arguments provided for object collation")
@@ -203,107 +387,126 @@ async def activity_handler(name: str, start: ScheduledEvent, sim: Simulator, veh
                 # print(f"Currently checking {vc}")
                 # print(sim.entities[vc].parent)
                 sim.entities[vc].parent = current_activity.agg_params['name']
+                touch(vc, "parent")
 
-            sim.add_vehicle(parent_vc, sim.clock + current_activity.duration)
+            sim.add_vehicle(parent_vc, (sim.tick + current_activity.duration_ticks) / TICKS_PER_UNIT)
 
         if current_activity.agg_type == "dejoin":
-            logging.info(f"\t  VEHICLES {vehicle.name} > decoupled CHILDREN:  {vehicle.children}")
+            if _info:
+                logger.info(f"\t  VEHICLES {vehicle.name} > decoupled CHILDREN:  {vehicle.children}")
             if len(vehicle.children) == 0:
                 raise Exception("No children in aggregate vehicle to dejoin")
             for child in vehicle.children:
                 sim.entities[child].parent = None
+                touch(child, "parent")
             vehicle.children = []
+            touch(vehicle.name, "children")
 
         if current_activity.agg_type == "dropchild":
-            logging.info(f"\t  VEHICLES {vehicle.name} > dropped CHILDREN:  {current_activity.agg_params['vehicles']}")
+            if _info:
+                logger.info(f"\t  VEHICLES {vehicle.name} > dropped CHILDREN:  {current_activity.agg_params['vehicles']}")
             for vc in current_activity.agg_params['vehicles']:
                 try:
                     sim.entities[vc].parent = None
                     vehicle.children.remove(vc)
                 except:
                     raise Exception(f"Child entity {vc} does not exist")
+                touch(vc, "parent")
+            touch(vehicle.name, "children")
 
         if current_activity.agg_type == "addchild":
-            logging.info(f"\t  VEHICLES {vehicle.name} > added CHILDREN:  {current_activity.agg_params['vehicles']}")
+            if _info:
+                logger.info(f"\t  VEHICLES {vehicle.name} > added CHILDREN:  {current_activity.agg_params['vehicles']}")
             vehicle.children.append(current_activity.agg_params['vehicles'][:])
             for vc in current_activity.agg_params['vehicles']:
                 if sim.entities[vc].parent != None:
                     raise Exception("Cannot add child entity which is already a child of another aggregate")
                 sim.entities[vc].parent = vehicle.name
+                touch(vc, "parent")
+            touch(vehicle.name, "children")
 
-    if isinstance(current_end, Failure):
-        next_event = FailureEvent(
-            current_activity.failure.name,
-            current_activity.failure,
-            sim.clock
-        )
-    
-    elif isinstance(current_end, Completor):
-        next_event = CompletionEvent(
-            current_end.name,
-            current_end,
-            sim.clock + current_activity.duration + sample(current_activity.delay),
-            state_update=state_update
-        )
-        # Update the vehicle to indicate the ConOps has compelted
-        vehicle.completed_conops = True
+    next_event = _BUILDERS[kind](sim, vehicle, current_activity, current_end, next_activity, state_update)
 
+    # ---------------------------------------------------------------------------------------------
+    # Return the next event to the simulation driver
+    sim._record(vehicle.vid, current_activity.id, clock)
+    return next_event
+
+
+# Builders for the event following an activity, indexed by the kind of event which ended it
+
+def _next_activity_event(sim, vehicle, current_activity, current_end, next_activity, state_update):
+    if next_activity is None:
+        # No activity of the ConOps starts at the end event, as ConOps.after reports it
+        raise KeyError(current_end.name)
+    if isinstance(current_activity, PredicatedActivity):
+        # Create the event, but don't schedule it
+        next_event = ScheduledEvent(
+            next_activity.start.name,
+            next_activity.start,
+            predicate = current_activity.predicate,
+            state_update=state_update,
+            vehicle=vehicle,
+            kind=EVENT_PREDICATED   # added to the predicates, not scheduled until satisfied
+        )
     else:
-        next_activity = vehicle.conops.after(current_end)
-
-        if isinstance(current_activity, PredicatedActivity):
-            # Create the event, but don't schedule it
-            next_event = ScheduledEvent(
-                next_activity.start.name,
-                next_activity.start,
-                predicate = current_activity.predicate,
-                state_update=state_update
-            )
-        else:
-            next_event = ScheduledEvent(
-                next_activity.start.name,
-                next_activity.start,
-                sim.clock + current_activity.duration + sample(current_activity.delay),
-                state_update=state_update
-            )
-
-        # Schedule the next activity, which will be waiting and started by the current end event
-        sim.tasks.append(
-            asyncio.create_task(
-                activity_handler(next_activity.name, next_event, sim, vehicle),
-                name = f"Vehicle: {vehicle.name} | Activity: {vehicle.activity.name}"
-            )
+        next_event = ScheduledEvent(
+            next_activity.start.name,
+            next_activity.start,
+            sim.tick + current_activity.duration_ticks + to_ticks(sample(current_activity.delay, sim.rng)),
+            state_update=state_update,
+            vehicle=vehicle
         )
 
-    # ---------------------------------------------------------------------------------------------
-    # Return control to the simulation driver by placing an event on the future queue
-    vehicle.update_trace(sim.clock)
-    sim.queue_future.put_nowait(next_event)
+    # The next activity of the vehicle will be started when the current end event is processed
+    vehicle.next_activity = next_activity
+    return next_event
+
+def _failure_event(sim, vehicle, current_activity, current_end, next_activity, state_update):
+    return FailureEvent(
+        current_activity.failure.name,
+        current_activity.failure,
+        sim.tick
+    )
 
+def _completion_event(sim, vehicle, current_activity, current_end, next_activity, state_update):
+    # Update the vehicle to indicate the ConOps has compelted
+    vehicle.completed_conops = True
+    sim.touch(vehicle.name, "completed_conops")
+    return CompletionEvent(
+        current_end.name,
+        current_end,
+        sim.tick + current_activity.duration_ticks + to_ticks(sample(current_activity.delay, sim.rng)),
+        state_update=state_update
+    )
 
-def check_activity_failure(activity, vehicle, sim):
+_BUILDERS = (_next_activity_event, _failure_event, _completion_event)   # END_NORMAL, END_FAILURE, END_COMPLETE
+
+
+def check_activity_failure(activity, vehicle, sim) -> bool:
     multievent = type(vehicle) == list
-    # Perform a bernoulli trial
-    trial = random.random()
-    if trial > (1 - activity.p_fail):
+    # Perform a bernoulli trial. Activities which cannot fail take no draw, like the ConOps handler
+    # which skips the trial, so that the random stream does not depend on which handler ran
+    if activity.p_fail != 0 and sim.bernoulli(activity.p_fail):
         if multievent:
             name = ""
             for v in vehicle:
                 name += v.name + "/"
-        logging.warning(f"  FAIL -- VEHICLE {vehicle.name} failed ACTIVITY:  {activity.name}")
+        if _warn:
+            logger.warning(f"  FAIL -- VEHICLE {vehicle.name} failed ACTIVITY:  {activity.name}")
 
         if not multievent:
             # Log failure to sim -- Vehicle X failed on activity Y at time Z
             sim.log_failure(sim.clock, vehicle.name, activity.name)
             # Handle the failure, update failure states
             vehicle.handle_failure()
+            sim.touch(vehicle.name, "state")
         else:
             for v in vehicle:
                 sim.log_failure(sim.clock, v.name, activity.name)
                 v.handle_failure()
+                sim.touch(v.name, "state")
 
-        outcome = activity.failure
-    else:
-        outcome = activity.end
+        return True
 
-    return outcome
+    return False
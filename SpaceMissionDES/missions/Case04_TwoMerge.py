@@ -3,7 +3,7 @@ import logging
 from objects.events import *
 from objects.activities import *
 from objects.vehicles import Vehicle
-from objects.predicates import Predicate, vehicle_in_activity
+from objects.predicates import Predicate, vehicle_in_activity, state_key
 
 together_conops = ConOps({})
 
@@ -36,7 +36,7 @@ def check_tanker_prop_transfer(p, sim):
     else:
         return False
 
-tanker_prop_transfered = Predicate("tanker_prop_transfered", check_tanker_prop_transfer)
+tanker_prop_transfered = Predicate("tanker_prop_transfered", check_tanker_prop_transfer, depends_on=(state_key("Tanker", "activity"),))
 # *********************************************************************
 
 # ConOps
@@ -87,7 +87,7 @@ def check_moonship_deployed(p, sim):
     else:
         return False
 
-moonship_predeployed = Predicate("moonship_predeployed", check_moonship_deployed)
+moonship_predeployed = Predicate("moonship_predeployed", check_moonship_deployed, depends_on=(state_key("MoonShip", "activity"),))
 # *********************************************************************
 
 # ConOps
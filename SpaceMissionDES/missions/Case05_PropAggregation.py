@@ -7,7 +7,7 @@ from scipy.stats import *
 from objects.events import *
 from objects.activities import *
 from objects.vehicles import Vehicle
-from objects.predicates import Predicate, vehicle_in_activity
+from objects.predicates import Predicate, vehicle_in_activity, state_key
 
 initial_vehicles = []
 
@@ -57,7 +57,7 @@ def check_transers(p, sim):
         logging.info(f"Predictate <{p.predicate.name}> Satisfied")
         return True
 
-until_N_transfers = Predicate(f"Wait until {N_transfers_required} propellant transfers are completed", check_transers)
+until_N_transfers = Predicate(f"Wait until {N_transfers_required} propellant transfers are completed", check_transers, depends_on=(state_key("Tanker", "state"),))
 
 # ConOps
 conops_MTV = ConOps({
@@ -1,12 +1,19 @@
 # activities.py
 from dataclasses import dataclass, field
-from objects.events import Event, Failure, Predicate
+from collections import Counter
+from objects.events import Event, Failure, Predicate, EVENT_IDS, intern_event, event_kind, to_ticks
+from objects.events import END_NORMAL, END_COMPLETE, ScheduledEvent, CompletionEvent
 from scipy import stats
 
+ACTIVITY_IDS = {}   # activity name -> interned integer id, used by the simulator trace
+
+def intern_activity(name: str) -> int:
+    return ACTIVITY_IDS.setdefault(name, len(ACTIVITY_IDS))
+
 #######################################################################################################################
 # Activities
 
-@dataclass
+@dataclass(slots=True)
 class Activity:
     name: str
     start: Event
@@ -24,9 +31,17 @@ class Activity:
     #   FOR addchild {vehicles: [va, vb]}
     #   FOR dropchild {vehicles: [va, vb]}
     update: dict = field(default_factory = lambda: {})
+    # Set by ConOps.finalize
+    id: int = field(default = None, init = False, repr = False, compare = False)
+    duration_ticks: int = field(default = None, init = False, repr = False, compare = False)
+    next_success: "Activity" = field(default = None, init = False, repr = False, compare = False)
+    next_failure: "Activity" = field(default = None, init = False, repr = False, compare = False)
+    conops: "ConOps" = field(default = None, init = False, repr = False, compare = False)   # owner of the links
+    end_kind: int = field(default = None, init = False, repr = False, compare = False)
+    failure_kind: int = field(default = None, init = False, repr = False, compare = False)
 
 
-@dataclass
+@dataclass(slots=True)
 class PredicatedActivity:
     name: str
     start: Event
@@ -39,13 +54,55 @@ class PredicatedActivity:
     agg_type: str = ""
     agg_params: list = field(default_factory = list)
     update: dict = field(default_factory = lambda: {})
+    # Set by ConOps.finalize
+    id: int = field(default = None, init = False, repr = False, compare = False)
+    next_success: "Activity" = field(default = None, init = False, repr = False, compare = False)
+    next_failure: "Activity" = field(default = None, init = False, repr = False, compare = False)
+    conops: "ConOps" = field(default = None, init = False, repr = False, compare = False)   # owner of the links
+    end_kind: int = field(default = None, init = False, repr = False, compare = False)
+    failure_kind: int = field(default = None, init = False, repr = False, compare = False)
 
 #######################################################################################################################
 # ConOps
 
-@dataclass
+@dataclass(slots=True)
 class ConOps:
     sequence: dict
+    seq_by_id: list = field(default = None, init = False, repr = False)   # event id -> activity starting at that event
+    handler: object = field(default = None, init = False, repr = False, compare = False)   # see _build_handler
+
+    def __post_init__(self):
+        self.finalize()
+
+    def __getstate__(self):
+        # The generated handler cannot be pickled, finalize builds it again
+        return self.sequence
+
+    def __setstate__(self, sequence):
+        self.sequence = sequence
+        self.finalize()
+
+    def finalize(self):
+        """Intern event and activity names and link every activity to the activities starting at its end and
+        failure events. Must be called again if `sequence` is edited directly instead of through `update`.
+
+        The links are stored on the activities, so an activity can only belong to one ConOps"""
+        for activity in self.sequence.values():
+            if activity.conops is not None and activity.conops is not self:
+                raise Exception(f"Activity {activity.name} already belongs to another ConOps, create a new activity instead")
+        event_ids = [intern_event(name) for name in self.sequence]
+        self.seq_by_id = [None] * len(EVENT_IDS)
+        for event_id, activity in zip(event_ids, self.sequence.values()):
+            self.seq_by_id[event_id] = activity
+            activity.id = intern_activity(activity.name)
+            activity.conops = self
+            activity.next_success = self.sequence.get(activity.end.name)
+            activity.next_failure = self.sequence.get(activity.failure.name)
+            activity.end_kind = event_kind(activity.end)
+            activity.failure_kind = event_kind(activity.failure)
+            if isinstance(activity, Activity):
+                activity.duration_ticks = to_ticks(activity.duration)
+        self.handler = _build_handler(self.sequence.values())
 
     def first(self):
         # print(self)
@@ -53,18 +110,79 @@ class ConOps:
 
     def after(self, current_event):
         # Get the activity which starts with a particular event
-        return self.sequence[current_event.name]
+        seq_by_id = self.seq_by_id
+        activity = seq_by_id[current_event.id] if current_event.id < len(seq_by_id) else None
+        if activity is None:
+            raise KeyError(current_event.name)
+        return activity
 
     def update(self, additions:dict):
         self.sequence.update(additions)
+        self.finalize()
         return self
 
+#######################################################################################################################
+# Specialized Event Handler
+
+def _build_handler(activities):
+    """Generate a replacement for drivers.simulator.handle_event specialized to a ConOps made only of plain
+    activities which cannot fail, end on a normal or completion event and do no aggregation.
+
+    The failure trial, branches, aggregations and predicated events are left out of the generated code, so are
+    the delay sampling and completion handling when no activity needs them. Returns None for other ConOps."""
+    activities = list(activities)
+    for activity in activities:
+        if type(activity) is not Activity or activity.p_fail != 0 or activity.agg_type:
+            return None
+        if activity.end_kind not in (END_NORMAL, END_COMPLETE):
+            return None
+        if activity.end_kind == END_NORMAL and activity.next_success is None:
+            return None
+    has_delay = any(activity.delay is not None for activity in activities)
+    has_completion = any(activity.end_kind == END_COMPLETE for activity in activities)
+
+    lines = [
+        "def handler(sim, vehicle, start):",
+        "    clock = sim.clock",
+        "    touch = sim.touch",
+        "    current_activity = vehicle.next_activity",
+        "    vehicle.activity = current_activity",
+        # Subtracting Counters drops the non-positive counts, so no resource can be left at 0 here
+        "    vehicle.resource = Counter(vehicle.resource) - Counter(current_activity.resource_change)",
+        "    touch(vehicle.name, 'activity')",
+        "    touch(vehicle.name, 'resource')",
+        "    def state_update():",
+        "        vehicle.update_state(current_activity.update)",
+        "        touch(vehicle.name, 'state')",
+        "    tick = sim.tick + current_activity.duration_ticks"
+        + (" + to_ticks(sample(current_activity.delay, sim.rng))" if has_delay else ""),
+    ]
+    if has_completion:
+        lines += [
+            "    if current_activity.end_kind == END_COMPLETE:",
+            "        vehicle.completed_conops = True",
+            "        touch(vehicle.name, 'completed_conops')",
+            "        sim._record(vehicle.vid, current_activity.id, clock)",
+            "        return CompletionEvent(current_activity.end.name, current_activity.end, tick, state_update=state_update)",
+        ]
+    lines += [
+        "    next_activity = current_activity.next_success",
+        "    vehicle.next_activity = next_activity",
+        "    sim._record(vehicle.vid, current_activity.id, clock)",
+        "    return ScheduledEvent(next_activity.start.name, next_activity.start, tick, state_update=state_update, vehicle=vehicle)",
+    ]
+
+    namespace = {}
+    exec("\n".join(lines), globals(), namespace)
+    return namespace["handler"]
+
 #######################################################################################################################
 # Utility Functions
 
-def sample(delay):
+def sample(delay, rng = None):
+    # Draw from rng, the simulator's generator, rather than the global NumPy state
     if delay is None:
         return 0.0
     else:
-        return delay.rvs()
+        return delay.rvs(random_state = rng)
 
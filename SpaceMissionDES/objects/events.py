@@ -1,40 +1,54 @@
 # events.py
 from dataclasses import dataclass, field
-from heapq import heappop, heappush
-import asyncio
-from typing import Callable
+from typing import Callable, ClassVar
 
 #######################################################################################################################
 # Event Templates
 
-@dataclass
+EVENT_IDS = {}  # event name -> interned integer id, shared by every ConOps
+
+def intern_event(name: str) -> int:
+    return EVENT_IDS.setdefault(name, len(EVENT_IDS))
+
+@dataclass(slots=True)
 class Event:
     """Object used to template events in a mission ConOps"""
     name: str
+    id: int = field(init=False, repr=False, compare=False)
 
-@dataclass
+    def __post_init__(self):
+        self.id = intern_event(self.name)
+
+@dataclass(slots=True)
 class Completor(Event):
     """Object used to indicate end of mission"""
     name: str
 
-    def __post_init__(self):
-        super().__init__(self.name)
-
-@dataclass
+@dataclass(slots=True)
 class Failure(Event):
     """Object used to indicate a mission has failed"""
 
     def __init__(self, name = "FAILURE"):
         self.name = name
+        self.id = intern_event(name)
 
-@dataclass
+@dataclass(slots=True)
 class Branch(Event):
     """Event with variable outcomes"""
     name: str
     logic: Callable
 
-    def __post_init__(self):
-        super().__init__(self.name)
+# Kinds of events ending an activity, precomputed for each activity by ConOps.finalize
+END_NORMAL, END_FAILURE, END_COMPLETE, END_BRANCH = 0, 1, 2, 3
+
+def event_kind(event: Event) -> int:
+    if isinstance(event, Failure):
+        return END_FAILURE
+    if isinstance(event, Completor):
+        return END_COMPLETE
+    if isinstance(event, Branch):
+        return END_BRANCH
+    return END_NORMAL
 
 #######################################################################################################################
 # Predicates
@@ -42,61 +56,62 @@ class Branch(Event):
 class Predicate:
     name: str
     check: Callable
+    depends_on: tuple = None    # state keys read by check, None re-checks the predicate after every event
+
+    def __post_init__(self):
+        if self.depends_on is None:
+            self.depends_on = getattr(self.check, "depends_on", None)
 
 #######################################################################################################################
 # Events with Times
 
-@dataclass(order=True)
-class ScheduledEvent(asyncio.Event):
+TICKS_PER_UNIT = 1000   # scheduled times are integer ticks, exact and cheap to compare in the future event heap
+
+def to_ticks(time: float) -> int:
+    return round(time * TICKS_PER_UNIT)
+
+# Kinds of events returned by handle_event, used by process_events to dispatch them
+EVENT_SCHEDULED, EVENT_FAILURE, EVENT_COMPLETION, EVENT_PREDICATED = 0, 1, 2, 3
+
+def no_state_update():
+    # Module level rather than a lambda so that scheduled events can be pickled
+    pass
+
+@dataclass(slots=True)
+class ScheduledEvent:
     name: str = field(compare=False)
     template: str = field(compare=False)
-    time: float = None
+    tick: int = None
     predicate: Predicate = field(compare=False, default=None)
-    state_update: Callable = field(compare=False, default=lambda: None)
+    state_update: Callable = field(compare=False, default=no_state_update)
+    vehicle: object = field(compare=False, default=None, repr=False)   # vehicle whose next activity this event starts
+    kind: int = field(compare=False, default=EVENT_SCHEDULED, repr=False)  # EVENT_PREDICATED when waiting on predicate
 
-    def __post_init__(self):
-        super().__init__()  # Make sure we inherit all of the attributes of the asyncio.Event class
+    @property
+    def time(self) -> float:
+        return self.tick / TICKS_PER_UNIT
 
-@dataclass(order=True)
-class CompletionEvent(asyncio.Event):
+@dataclass(slots=True)
+class CompletionEvent:
+    kind: ClassVar[int] = EVENT_COMPLETION
     name: str = field(compare=False)
     template: str = field(compare=False)
-    time: float
+    tick: int
     predicate: Predicate = field(compare=False, default=None)
-    state_update: Callable = field(compare=False, default=lambda: None)
+    state_update: Callable = field(compare=False, default=no_state_update)
 
-    def __post_init__(self):
-        super().__init__()  # Make sure we inherit all of the attributes of the asyncio.Event class
+    @property
+    def time(self) -> float:
+        return self.tick / TICKS_PER_UNIT
 
-@dataclass(order=True)
-class FailureEvent(asyncio.Event):
+@dataclass(slots=True)
+class FailureEvent:
+    kind: ClassVar[int] = EVENT_FAILURE
     name: str = field(compare=False)
     template: str = field(compare=False)
-    time: float
+    tick: int
     predicate: Predicate = field(compare=False, default=None)
 
-    def __post_init__(self):
-        super().__init__()
-
-
-#######################################################################################################################
-# Future Event List
-
-class FutureEventList:
-    def __init__(self):
-        self.events = []
-        
-    def __iter__(self):
-        return self
-    
-    def __next__(self) -> ScheduledEvent:
-        if self.events:
-            return heappop(self.events)
-        raise StopIteration
-
-    def __repr__(self) -> str:
-        from pprint import pformat
-        return pformat(self.events)
-
-    def get_next(self):
-        return heappop(self.events)
\ No newline at end of file
+    @property
+    def time(self) -> float:
+        return self.tick / TICKS_PER_UNIT
@@ -9,6 +9,16 @@ from typing import Callable
 class Predicate:
     name: str
     check: Callable
+    depends_on: tuple = None    # state keys read by check, None re-checks the predicate after every event
+
+    def __post_init__(self):
+        if self.depends_on is None:
+            self.depends_on = getattr(self.check, "depends_on", None)
+
+
+def state_key(vehicle: str, attr: str) -> str:
+    """Key for a piece of vehicle state which predicates can depend on, e.g. vehicle:Tanker:activity"""
+    return f"vehicle:{vehicle}:{attr}"
 
 
 def check_func(p, sim, vehicle, activity):
@@ -25,7 +35,9 @@ def check_func(p, sim, vehicle, activity):
 
 
 def vehicle_in_activity(vehicle: str, activity: str):
-    return partial(check_func, vehicle = vehicle, activity = activity)
+    check = partial(check_func, vehicle = vehicle, activity = activity)
+    check.depends_on = (state_key(vehicle, "activity"),)
+    return check
 
 
 # p = Predicate("test", check_conditions)
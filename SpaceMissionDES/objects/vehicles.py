@@ -1,6 +1,5 @@
 # vehicles.py
 from dataclasses import dataclass, field
-import pandas as pd
 from collections import Counter
 
 from objects.activities import Activity, ConOps
@@ -17,8 +16,9 @@ class Vehicle:
     children: list = field(default_factory = list)
     parent: str = None
     activity: Activity = None
+    next_activity: Activity = None  # activity started by the vehicle's pending event
     completed_conops: bool = False
-    trace: pd.DataFrame = pd.DataFrame(columns=['Time', 'CurrentEvent', 'NextEvent', 'Prop', 'Activity'])
+    vid: int = None     # id assigned by the simulator, used in its trace
     state: list = field(default_factory = lambda: {'failures': 0})
     
     @staticmethod
@@ -49,18 +49,6 @@ class Vehicle:
     def __repr__(self):
         return (f'{self.__class__.__name__} - {self.name}')
 
-    def update_trace(self, sim_time):
-        self.trace = pd.concat([
-            self.trace,
-            pd.DataFrame({
-                "Time": sim_time,
-                "CurrentEvent": self.activity.start, 
-                "NextEvent": self.activity.end, 
-                "Resource": self.resource, 
-                "Activity": self.activity}, index = [len(self.trace) + 1])
-        ])
-        #TODO: add dynamic resource reporting to the vehicle trace
-
     def handle_failure(self):
         self.state['failures'] += 1
 
@@ -32,11 +32,8 @@ if __name__ == "__main__":
     # sim.predicates.append(Predicate("test", check_conditions))
     print("\n***********\n***BEGIN***\n")
 
-    try:
-        asyncio.run(
-            sim.run(initial_vehicles)
-        )
-    except asyncio.CancelledError:
+    sim.run(initial_vehicles)
+    if not sim.success:
         logging.warning("CONOPS FAILED")
 
     print("\n***DONE****\n***********")